@@ -0,0 +1,79 @@
+"""Задержка ленты новостей в зависимости от размера истории.
+
+Для каждого размера истории создаётся отдельная база: HOT_ROWS свежих
+новостей и остальные — старше года. Лента (выборка, как в GET /api/news)
+замеряется до и после переноса старых новостей в архив.
+
+    python benchmarks/bench_archive.py
+"""
+import datetime
+import os
+import sys
+import tempfile
+import time
+
+import sqlalchemy as sa
+from sqlalchemy import orm
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from data import db_models, news_stats  # noqa: E402,F401
+from data.db_session import SqlAlchemyBase  # noqa: E402
+from data.news import News  # noqa: E402
+from data.news_archive import archive_news  # noqa: E402
+
+HOT_ROWS = 1000
+HISTORY_SIZES = (10_000, 50_000, 200_000)
+REPEAT = 5
+
+
+def make_db(path, total):
+    engine = sa.create_engine(f'sqlite:///{path}')
+    SqlAlchemyBase.metadata.create_all(engine)
+    news_stats.install(engine)
+
+    now = datetime.datetime.now()
+    old = now - datetime.timedelta(days=800)
+    rows = [
+        {
+            'title': f'Новость {i}',
+            'content': f'Текст новости номер {i}. ' * 20,
+            'user_id': 1,
+            'is_private': False,
+            'create_date': old if i < total - HOT_ROWS else now
+        }
+        for i in range(total)
+    ]
+    with engine.begin() as conn:
+        conn.execute(sa.insert(News), rows)
+    return engine
+
+
+def feed_latency(factory):
+    timings = []
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        with factory() as db_sess:
+            news = db_sess.query(News).all()
+            [item.to_dict(only=('title', 'content')) for item in news]
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    return timings[len(timings) // 2] * 1000
+
+
+def main():
+    print(f'{"история":>10} {"до, мс":>10} {"после, мс":>10}')
+    for total in HISTORY_SIZES:
+        with tempfile.TemporaryDirectory() as tmp:
+            engine = make_db(os.path.join(tmp, 'bench.sqlite'), total)
+            factory = orm.sessionmaker(bind=engine)
+            before = feed_latency(factory)
+            with factory() as db_sess:
+                archive_news(db_sess, datetime.timedelta(days=365))
+            after = feed_latency(factory)
+            engine.dispose()
+        print(f'{total:>10} {before:>10.1f} {after:>10.1f}')
+
+
+if __name__ == '__main__':
+    main()
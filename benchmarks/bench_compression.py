@@ -0,0 +1,88 @@
+"""Сжатие News.content: размер базы, скорость списка и чтения одной новости.
+
+Одни и те же новости записываются в две базы — без сжатия и со сжатием
+(CompressedString). Список читает все новости без текста (как страница
+со списком заголовков), одиночное чтение — случайные новости по id.
+
+    python benchmarks/bench_compression.py
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+import sqlalchemy as sa
+from sqlalchemy import orm
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from data import db_models  # noqa: E402,F401
+from data.db_session import SqlAlchemyBase  # noqa: E402
+from data.news import News  # noqa: E402
+
+ROWS = 20_000
+READS = 2_000
+REPEAT = 5
+
+WORDS = ('новость компания проект тестирование сайт пользователь данные '
+         'сервер ошибка релиз версия функция запрос ответ клиент система '
+         'производительность безопасность интерфейс база обновление команда '
+         'результат работа неделя отчёт задача решение вопрос').split()
+
+
+def article(rnd):
+    return ' '.join(rnd.choice(WORDS) for _ in range(rnd.randint(300, 900)))
+
+
+def make_db(path, threshold, rows):
+    News.__table__.c.content.type.threshold = threshold
+    engine = sa.create_engine(f'sqlite:///{path}')
+    SqlAlchemyBase.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(sa.insert(News), rows)
+    return engine
+
+
+def median_ms(func):
+    timings = []
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    return timings[len(timings) // 2] * 1000
+
+
+def main():
+    rnd = random.Random(1)
+    rows = [{'title': f'Новость {i}', 'content': article(rnd), 'user_id': 1,
+             'is_private': False} for i in range(ROWS)]
+    ids = [rnd.randint(1, ROWS) for _ in range(READS)]
+
+    print(f'{"":>12} {"размер, МБ":>11} {"список, мс":>11} {f"{READS} чтений, мс":>17}')
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, threshold in (('без сжатия', None), ('со сжатием', 1024)):
+            path = os.path.join(tmp, f'{threshold}.sqlite')
+            engine = make_db(path, threshold, rows)
+            factory = orm.sessionmaker(bind=engine)
+
+            def listing():
+                with factory() as db_sess:
+                    db_sess.execute(sa.select(News.id, News.title, News.user_id,
+                                              News.is_private)).all()
+
+            def single_reads():
+                with factory() as db_sess:
+                    for news_id in ids:
+                        db_sess.execute(sa.select(News.content)
+                                        .where(News.id == news_id)).scalar()
+
+            size = os.path.getsize(path) / 2 ** 20
+            print(f'{name:>12} {size:>11.1f} {median_ms(listing):>11.1f} '
+                  f'{median_ms(single_reads):>17.1f}')
+            engine.dispose()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""Смешанная нагрузка: чтение ленты и запись новостей одновременно.
+
+Сравниваются две конфигурации SessionManager на одной и той же базе:
+все сессии на основном движке (по умолчанию) и чтение с отдельного
+движка mode=ro (sqlite_reader=True). Каждая конфигурация запускается в своём процессе,
+потому что SessionManager — синглтон.
+
+    python benchmarks/bench_replicas.py
+"""
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import sqlalchemy as sa
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from data.db_session import session_manager  # noqa: E402
+from data.news import News  # noqa: E402
+
+ROWS = 5_000
+READERS = 8
+WRITERS = 2
+DURATION = 10.0
+FEED_SIZE = 200
+
+
+def run(path, mode):
+    session_manager.global_init(path, sqlite_reader=mode == 'split')
+    sys.stdout.flush()
+    stop = time.perf_counter() + DURATION
+    reads, writes = [], []
+
+    def reader():
+        while time.perf_counter() < stop:
+            start = time.perf_counter()
+            with session_manager.create_session(read_only=True) as db_sess:
+                db_sess.scalars(sa.select(News).order_by(News.id.desc()).limit(FEED_SIZE)).all()
+            reads.append(time.perf_counter() - start)
+
+    def writer():
+        while time.perf_counter() < stop:
+            start = time.perf_counter()
+            with session_manager.create_session(read_only=False) as db_sess:
+                db_sess.add(News(title='Новость', content='Текст новости', user_id=1,
+                                 is_private=False))
+                db_sess.commit()
+            writes.append(time.perf_counter() - start)
+
+    threads = ([threading.Thread(target=reader) for _ in range(READERS)]
+               + [threading.Thread(target=writer) for _ in range(WRITERS)])
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    reads.sort()
+    p95 = reads[int(len(reads) * 0.95)] * 1000 if reads else 0.0
+    print(f'{mode:>8} {len(reads) / DURATION:>12.0f} {p95:>14.1f} '
+          f'{len(writes) / DURATION:>12.0f}')
+
+
+def prepare(path):
+    session_manager.global_init(path)
+    with session_manager.create_session() as db_sess:
+        db_sess.execute(sa.insert(News), [
+            {'title': f'Новость {i}', 'content': 'Текст новости ' * 50,
+             'user_id': 1, 'is_private': False}
+            for i in range(ROWS)
+        ])
+        db_sess.commit()
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        template = os.path.join(tmp, 'template.sqlite')
+        subprocess.run([sys.executable, __file__, 'prepare', template], check=True,
+                       stdout=subprocess.DEVNULL)
+        print(f'{"":>8} {"чтений/с":>12} {"чтение p95, мс":>14} {"записей/с":>12}')
+        for mode in ('single', 'split'):
+            path = os.path.join(tmp, f'{mode}.sqlite')
+            shutil.copy(template, path)
+            subprocess.run([sys.executable, __file__, mode, path], check=True)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) == 3:
+        action, db_path = sys.argv[1:]
+        if action == 'prepare':
+            prepare(db_path)
+        else:
+            run(db_path, action)
+    else:
+        main()
@@ -0,0 +1,94 @@
+import time
+import zlib
+from typing import Optional
+
+import sqlalchemy
+from sqlalchemy import orm
+
+# Тексты длиннее стольких байт сохраняются сжатыми; None — не сжимать
+CONTENT_COMPRESS_THRESHOLD = 1024
+COMPRESS_BATCH_SIZE = 200
+
+
+class CompressedString(sqlalchemy.types.TypeDecorator):
+    """Строка, которая хранится сжатой, если она длиннее порога.
+
+    Сжатое значение записывается как BLOB: MARKER + данные zlib. Короткие
+    строки и все строки, записанные до появления сжатия, остаются обычным
+    текстом, поэтому старые базы читаются без миграции.
+
+    Работает только в SQLite, где в текстовую колонку можно записать BLOB;
+    в других СУБД значения хранятся как обычные строки.
+    """
+
+    impl = sqlalchemy.String
+    cache_ok = True
+
+    MARKER = b'\x00zlib1'
+
+    def __init__(self, *args, threshold: Optional[int] = CONTENT_COMPRESS_THRESHOLD, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.threshold = threshold
+
+    def process_bind_param(self, value, dialect):
+        if value is None or self.threshold is None or dialect.name != 'sqlite':
+            return value
+        raw = value.encode('utf-8')
+        if len(raw) < self.threshold:
+            return value
+        packed = self.MARKER + zlib.compress(raw)
+        return packed if len(packed) < len(raw) else value
+
+    def process_result_value(self, value, dialect):
+        if isinstance(value, bytes):
+            if value.startswith(self.MARKER):
+                value = zlib.decompress(value[len(self.MARKER):])
+            return value.decode('utf-8')
+        return value
+
+
+def compress_existing(db_sess: orm.Session, column: sqlalchemy.Column,
+                      batch_size: int = COMPRESS_BATCH_SIZE, pause: float = 0.0,
+                      progress=None) -> int:
+    """Пересохранение несжатых длинных значений column в сжатом виде.
+
+    Строки обходятся по id пачками, каждая пачка — отдельная короткая
+    транзакция с паузой pause секунд между ними, чтобы миграция могла
+    идти на работающем сайте. Версии строк не меняются: содержимое то же.
+    Возвращает число просмотренных строк; вне SQLite ничего не делает.
+    """
+    table = column.table
+    threshold = column.type.threshold
+    if threshold is None:
+        return 0
+    if db_sess.get_bind().dialect.name != 'sqlite':
+        print("[WARN] Сжатие текстов поддерживается только для SQLite, строки не изменены.")
+        return 0
+
+    update = (
+        sqlalchemy.update(table)
+        .where(table.c.id == sqlalchemy.bindparam('row_id'))
+        .values({column.name: sqlalchemy.bindparam('value')})
+    )
+    last_id, seen = 0, 0
+    while True:
+        rows = db_sess.execute(
+            sqlalchemy.select(table.c.id, column)
+            .where(table.c.id > last_id,
+                   sqlalchemy.func.typeof(column) == 'text',
+                   sqlalchemy.func.length(
+                       sqlalchemy.cast(column, sqlalchemy.LargeBinary)) >= threshold)
+            .order_by(table.c.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            return seen
+
+        db_sess.execute(update, [{'row_id': row.id, 'value': row[1]} for row in rows])
+        db_sess.commit()
+        last_id = rows[-1].id
+        seen += len(rows)
+        if progress:
+            progress(seen)
+        if pause:
+            time.sleep(pause)
@@ -1,2 +1,5 @@
 from . import users
 from . import news
+from . import news_archive
+from . import news_stats
+from . import news_changes
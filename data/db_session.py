@@ -1,10 +1,19 @@
+import itertools
+import os
+from contextvars import ContextVar
+
 import sqlalchemy as sa
 import sqlalchemy.orm as orm
 from sqlalchemy.orm import Session, declarative_base
-from typing import Optional
+from typing import Optional, Sequence
 
 SqlAlchemyBase = declarative_base()
 
+# Куда направлять сессии текущего запроса/потока: True — на читающие движки
+_read_only: ContextVar[bool] = ContextVar('read_only', default=False)
+# Была ли в текущем запросе/потоке завершённая запись (для read-your-writes)
+_wrote: ContextVar[bool] = ContextVar('wrote', default=False)
+
 
 class SessionManager:
     """Singleton-класс для управления сессиями SQLAlchemy."""
@@ -15,10 +24,20 @@ class SessionManager:
         if cls._instance is None:
             cls._instance = super(SessionManager, cls).__new__(cls)
             cls._instance._session_factory = None
+            cls._instance._reader_factories = None
         return cls._instance
 
-    def global_init(self, db_file: str) -> None:
-        """Инициализация подключения к базе данных."""
+    def global_init(self, db_file: str, replicas: Sequence[str] = (),
+                    sqlite_reader: bool = False) -> None:
+        """Инициализация подключения к базе данных.
+
+        db_file — путь к файлу SQLite или URL базы данных. replicas — URL
+        реплик только для чтения, на них идут сессии route_reads(True).
+        sqlite_reader=True для SQLite без реплик открывает тот же файл
+        вторым движком в режиме mode=ro. По умолчанию выключено: в режиме
+        WAL читатели и так не ждут запись, и замер bench_replicas.py
+        выигрыша не показал; без реплик все сессии идут на основной движок.
+        """
         if self._session_factory is not None:
             return
 
@@ -26,21 +45,144 @@ class SessionManager:
         if not db_file:
             raise ValueError("Необходимо указать путь к файлу базы данных.")
 
-        conn_str = f"sqlite:///{db_file}?check_same_thread=False"
+        is_sqlite = '://' not in db_file
+        conn_str = f"sqlite:///{db_file}?check_same_thread=False" if is_sqlite else db_file
         print(f"[INFO] Подключение к базе данных: {conn_str}")
 
         engine = sa.create_engine(conn_str, echo=False)
+        if is_sqlite:
+            # WAL: читатели не блокируют запись и не ждут её окончания
+            sa.event.listen(engine, 'connect', _sqlite_pragmas('PRAGMA journal_mode = WAL'))
         self._session_factory = orm.sessionmaker(bind=engine)
+        sa.event.listen(self._session_factory, 'after_commit', _mark_write)
 
-        from . import db_models  # noqa: F401
+        from . import db_models
         SqlAlchemyBase.metadata.create_all(engine)
+        self._upgrade_schema(engine)
+        db_models.news_archive.install(engine)
+        db_models.news_stats.install(engine)
+        db_models.news_changes.install(engine)
+
+        if sqlite_reader and is_sqlite and not replicas:
+            replicas = [self._sqlite_reader_url(db_file)]
+        readers = []
+        for url in replicas:
+            print(f"[INFO] Реплика для чтения: {url}")
+            reader = sa.create_engine(url, echo=False)
+            if url.startswith('sqlite'):
+                sa.event.listen(reader, 'connect', _sqlite_pragmas('PRAGMA query_only = ON'))
+            readers.append(orm.sessionmaker(bind=reader))
+        self._reader_factories = itertools.cycle(readers) if readers else None
+
+    @staticmethod
+    def _sqlite_reader_url(db_file: str) -> str:
+        path = os.path.abspath(db_file).replace(os.sep, '/')
+        return f"sqlite:///file:{path}?mode=ro&uri=true&check_same_thread=False"
+
+    @staticmethod
+    def _upgrade_schema(engine: sa.Engine) -> None:
+        """Досоздание колонок и индексов, которых нет в существующих таблицах.
 
-    def create_session(self) -> Session:
-        """Создание новой сессии."""
+        create_all() не трогает существующие таблицы, поэтому колонки и
+        индексы, добавленные в модели позже, создаются здесь. Новые колонки
+        должны быть nullable или иметь server_default. Таблицы SQLite, которым
+        модель задаёт sqlite_autoincrement, пересоздаются с AUTOINCREMENT.
+        """
+        inspector = sa.inspect(engine)
+        existing_tables = set(inspector.get_table_names())
+        with engine.begin() as conn:
+            for table in SqlAlchemyBase.metadata.sorted_tables:
+                if table.name not in existing_tables:
+                    continue
+                columns = {column['name'] for column in inspector.get_columns(table.name)}
+                for column in table.columns:
+                    if column.name in columns:
+                        continue
+                    ddl = sa.schema.CreateColumn(column).compile(dialect=engine.dialect)
+                    conn.execute(sa.text(f'ALTER TABLE {table.name} ADD COLUMN {ddl}'))
+
+                indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+                for index in table.indexes:
+                    if index.name not in indexes:
+                        index.create(conn)
+
+                if (engine.dialect.name == 'sqlite'
+                        and table.dialect_options['sqlite']['autoincrement']):
+                    SessionManager._add_autoincrement(conn, table)
+
+    @staticmethod
+    def _add_autoincrement(conn: sa.Connection, table: sa.Table) -> None:
+        """Пересоздание таблицы SQLite с AUTOINCREMENT, если его нет.
+
+        Добавить AUTOINCREMENT через ALTER TABLE нельзя: старая таблица
+        переименовывается, новая создаётся по модели (вместе с индексами),
+        строки копируются с теми же id. Триггеры уходят вместе со старой
+        таблицей — install() модулей создаёт их заново.
+        """
+        ddl = conn.scalar(
+            sa.text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :name"),
+            {'name': table.name}
+        )
+        if 'AUTOINCREMENT' in ddl.upper():
+            return
+
+        print(f"[INFO] Пересоздание таблицы {table.name} с AUTOINCREMENT")
+        old = f'_{table.name}_old'
+        conn.execute(sa.text(f'ALTER TABLE {table.name} RENAME TO {old}'))
+        for index in sa.inspect(conn).get_indexes(old):
+            conn.execute(sa.text(f'DROP INDEX {index["name"]}'))
+        table.create(conn)
+        columns = ', '.join(column.name for column in table.columns)
+        conn.execute(sa.text(f'INSERT INTO {table.name} ({columns}) SELECT {columns} FROM {old}'))
+        conn.execute(sa.text(f'DROP TABLE {old}'))
+
+    def create_session(self, read_only: Optional[bool] = None) -> Session:
+        """Создание новой сессии.
+
+        read_only=True — сессия на реплике для чтения (если они есть),
+        False — на основном движке. По умолчанию решает route_reads().
+        """
         if self._session_factory is None:
             raise RuntimeError("Session factory не инициализирован. Вызовите global_init() сначала.")
+        if read_only is None:
+            read_only = _read_only.get()
+        if read_only and self._reader_factories is not None:
+            return next(self._reader_factories)()
         return self._session_factory()
 
+    @staticmethod
+    def route_reads(read_only: bool) -> tuple:
+        """Направлять сессии текущего запроса на реплики (True) или на
+        основной движок (False); сбрасывает признак записи. Возвращает
+        токен для reset_routing() в конце запроса."""
+        return _read_only.set(read_only), _wrote.set(False)
+
+    @staticmethod
+    def reset_routing(token: tuple) -> None:
+        """Возврат маршрутизации к состоянию до route_reads(), чтобы она
+        не досталась следующему коду в том же потоке."""
+        read_only_token, wrote_token = token
+        _read_only.reset(read_only_token)
+        _wrote.reset(wrote_token)
+
+    @staticmethod
+    def wrote() -> bool:
+        """Была ли запись в базу после последнего route_reads()."""
+        return _wrote.get()
+
+
+def _sqlite_pragmas(*pragmas: str):
+    def on_connect(dbapi_connection, _):
+        cursor = dbapi_connection.cursor()
+        for pragma in pragmas:
+            cursor.execute(pragma)
+        cursor.close()
+    return on_connect
+
+
+def _mark_write(session: Session) -> None:
+    _wrote.set(True)
+
 
 # Экземпляр-синглтон
 session_manager = SessionManager()
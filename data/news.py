@@ -1,5 +1,6 @@
 import datetime
 import sqlalchemy
+from .compression import CompressedString
 from .db_session import SqlAlchemyBase
 from sqlalchemy_serializer import SerializerMixin
 from sqlalchemy import orm
@@ -7,21 +8,36 @@ from sqlalchemy import orm
 
 class News(SqlAlchemyBase, SerializerMixin):
     __tablename__ = 'news'
+    # AUTOINCREMENT: id удалённых и перенесённых в архив новостей не
+    # выдаются повторно (по id их различают архив и триггеры)
+    __table_args__ = {'sqlite_autoincrement': True}
+
+    is_archived = False
 
     id = sqlalchemy.Column(sqlalchemy.Integer,
                            primary_key=True,
                            autoincrement=True)
     title = sqlalchemy.Column(sqlalchemy.String,
                               nullable=True)
-    content = sqlalchemy.Column(sqlalchemy.String,
+    # длинные тексты хранятся сжатыми, см. data/compression.py
+    content = sqlalchemy.Column(CompressedString(),
                                 nullable=True)
     create_date = sqlalchemy.Column(sqlalchemy.DateTime,
-                                    default=datetime.datetime.now())
+                                    default=datetime.datetime.now,
+                                    index=True)
     is_private = sqlalchemy.Column(sqlalchemy.Boolean,
                                    default=True)
     user_id = sqlalchemy.Column(sqlalchemy.Integer,
-                                sqlalchemy.ForeignKey("users.id"))
-    user = orm.relationship('User')
+                                sqlalchemy.ForeignKey("users.id"),
+                                index=True)
+    user = orm.relationship('User', back_populates='news')
+    # номер версии строки для оптимистичной блокировки:
+    # ORM и update-запросы увеличивают его при каждом изменении
+    version = sqlalchemy.Column(sqlalchemy.Integer,
+                                nullable=False, default=1,
+                                server_default='1')
+
+    __mapper_args__ = {'version_id_col': version}
 
     def __repr__(self):
         return f'<News: {self.title}: {self.content}>'
@@ -1,8 +1,14 @@
 import flask
-from flask import jsonify, make_response, request
+import sqlalchemy as sa
+from flask import abort, jsonify, make_response, request
+from flask_login import current_user
 
+from . import news_changes, news_stats
 from .db_session import session_manager
+from .profiler import profiler
+from .rate_limit import limiter
 from .news import News
+from .news_archive import ArchivedNews, archive_requested
 from .users import User
 
 blueprint = flask.Blueprint(
@@ -11,14 +17,30 @@ blueprint = flask.Blueprint(
     template_folder='templates'
 )
 
+# Сколько последних новостей показывать в карточке пользователя
+USER_NEWS_PREVIEW = 5
+# Размер страницы для /api/users/<id>/news
+USER_NEWS_PAGE_SIZE = 20
+USER_NEWS_MAX_PAGE_SIZE = 100
+
+USER_NEWS_FIELDS = ('id', 'title', 'content', 'is_private')
+
 
 @blueprint.route('/api/news', methods=['GET'])
+@limiter.limit('news_list', per_minute=60, burst=20, route_class='heavy')
 def get_news():
     """
-    Получить список всех новостей
+    Получить список новостей
     ---
     tags:
       - News
+    parameters:
+      - name: archive
+        in: query
+        required: false
+        description: 1 — добавить в список новости из архива
+        schema:
+          type: integer
     responses:
       200:
         description: Список новостей
@@ -41,9 +63,15 @@ def get_news():
                         properties:
                           name:
                             type: string
+      429:
+        description: Слишком много запросов от клиента
+      503:
+        description: Сервер перегружен, повторите позже
     """
     with session_manager.create_session() as db_sess:
         news = db_sess.query(News).all()
+        if archive_requested(request.args):
+            news += db_sess.query(ArchivedNews).order_by(ArchivedNews.id).all()
         return jsonify(
             {
                 'news': [
@@ -53,6 +81,100 @@ def get_news():
         )
 
 
+@blueprint.route('/api/news/changes', methods=['GET'])
+def get_news_changes():
+    """
+    Изменения новостей с момента прошлой синхронизации
+    ---
+    tags:
+      - News
+    parameters:
+      - name: since
+        in: query
+        required: false
+        description: токен next из прошлого ответа (без него — все новости)
+        schema:
+          type: string
+      - name: limit
+        in: query
+        required: false
+        schema:
+          type: integer
+          default: 500
+          maximum: 1000
+    responses:
+      200:
+        description: Изменения по порядку; если has_more, запросите ещё раз с since=next
+        content:
+          application/json:
+            schema:
+              type: object
+              properties:
+                changes:
+                  type: array
+                  items:
+                    type: object
+                    properties:
+                      id:
+                        type: integer
+                      op:
+                        type: string
+                        enum: [upsert, delete, archive]
+                      news:
+                        type: object
+                        nullable: true
+                        properties:
+                          title:
+                            type: string
+                          content:
+                            type: string
+                          user_id:
+                            type: integer
+                          is_private:
+                            type: boolean
+                          version:
+                            type: integer
+                next:
+                  type: string
+                has_more:
+                  type: boolean
+      400:
+        description: Некорректные параметры
+      410:
+        description: Токен устарел, нужна полная синхронизация (since не передавать)
+    """
+    limit = request.args.get('limit', news_changes.CHANGES_PAGE_SIZE, type=int)
+    if limit < 1 or limit > news_changes.CHANGES_MAX_PAGE_SIZE:
+        return make_response(jsonify({'error': 'Bad request'}), 400)
+
+    with session_manager.create_session() as db_sess:
+        try:
+            result = news_changes.get_changes(db_sess, request.args.get('since'), limit)
+        except ValueError:
+            return make_response(jsonify({'error': 'Bad sync token'}), 400)
+        if result is None:
+            return make_response(jsonify({'error': 'Sync token expired', 'reset': True}), 410)
+        changes, news, has_more, next_token = result
+
+        items = []
+        for change in changes:
+            item = news.get(change.news_id)
+            op = change.op if change.op != news_changes.UPSERT or item else news_changes.DELETE
+            items.append({
+                'id': change.news_id,
+                'op': op,
+                'news': item.to_dict(only=('title', 'content', 'user_id', 'is_private', 'version'))
+                if op == news_changes.UPSERT else None
+            })
+        return jsonify(
+            {
+                'changes': items,
+                'next': next_token,
+                'has_more': has_more
+            }
+        )
+
+
 @blueprint.route('/api/news/<int:news_id>', methods=['GET'])
 def get_one_news(news_id):
     """
@@ -92,11 +214,13 @@ def get_one_news(news_id):
         news = db_sess.query(News).get(news_id)
         if not news:
             return make_response(jsonify({'error': 'Not found'}), 404)
-        return jsonify(
+        response = jsonify(
             {
                 'news': news.to_dict(only=('title', 'content', 'user_id', 'is_private'))
             }
         )
+        response.set_etag(str(news.version))
+        return response
 
 
 @blueprint.route('/api/news', methods=['POST'])
@@ -204,6 +328,12 @@ def update_news(news_id):
         required: true
         schema:
           type: integer
+      - name: If-Match
+        in: header
+        required: false
+        description: ETag (версия), полученный из GET /api/news/<id>
+        schema:
+          type: string
     requestBody:
       required: true
       content:
@@ -233,27 +363,32 @@ def update_news(news_id):
         description: Некорректный запрос
       404:
         description: Новость не найдена
+      412:
+        description: Версия из If-Match устарела, новость изменил кто-то другой
     """
     if not request.json:
         return make_response(jsonify({'error': 'Empty request'}), 400)
 
-    with session_manager.create_session() as db_sess:
-        news = db_sess.query(News).filter(News.id == news_id).first()
-        if not news:
-            return make_response(jsonify({'error': 'News not found'}), 404)
+    values = {key: request.json[key] for key in
+              ('title', 'content', 'user_id', 'is_private') if key in request.json}
+    try:
+        expected_version = _if_match_version()
+    except ValueError:
+        return make_response(jsonify({'error': 'Bad If-Match header'}), 400)
 
+    with session_manager.create_session() as db_sess:
         try:
-            if 'title' in request.json:
-                news.title = request.json['title']
-            if 'content' in request.json:
-                news.content = request.json['content']
-            if 'user_id' in request.json:
-                news.user_id = request.json['user_id']
-            if 'is_private' in request.json:
-                news.is_private = request.json['is_private']
+            new_version = _versioned_update(db_sess, News, news_id, values, expected_version)
+            if new_version is None:
+                db_sess.rollback()
+                if db_sess.get(News, news_id) is None:
+                    return make_response(jsonify({'error': 'News not found'}), 404)
+                return make_response(jsonify({'error': 'Precondition failed'}), 412)
 
             db_sess.commit()
-            return jsonify({'success': True})
+            response = jsonify({'success': True})
+            response.set_etag(str(new_version))
+            return response
 
         except Exception as e:
             db_sess.rollback()
@@ -261,6 +396,7 @@ def update_news(news_id):
 
 
 @blueprint.route('/api/user', methods=['POST'])
+@limiter.limit('api_register', per_minute=10, burst=5, route_class='auth')
 def register():
     """
     Регистрация пользователя
@@ -304,6 +440,10 @@ def register():
         description: Ошибка в параметрах
       409:
         description: Пользователь с таким email уже существует
+      429:
+        description: Слишком много запросов от клиента
+      503:
+        description: Сервер перегружен, повторите позже
     """
     try:
         data = request.get_json()
@@ -349,6 +489,12 @@ def update_user(user_id):
         required: true
         schema:
           type: integer
+      - name: If-Match
+        in: header
+        required: false
+        description: ETag (версия), полученный из GET /api/users/<id>
+        schema:
+          type: string
     requestBody:
       required: true
       content:
@@ -378,6 +524,8 @@ def update_user(user_id):
         description: Пустой запрос
       404:
         description: Пользователь не найден
+      412:
+        description: Версия из If-Match устарела
     """
     try:
         data = request.get_json()
@@ -385,20 +533,27 @@ def update_user(user_id):
         if not data:
             return jsonify({'error': 'Пустой запрос'}), 400
 
-        with session_manager.create_session() as db_sess:
-            user = db_sess.query(User).get(user_id)
-            if not user:
-                return jsonify({'error': 'Пользователь не найден'}), 404
+        try:
+            expected_version = _if_match_version()
+        except ValueError:
+            return jsonify({'error': 'Некорректный заголовок If-Match'}), 400
 
-            for field in ('name', 'email', 'about'):
-                if field in data:
-                    setattr(user, field, data[field])
+        values = {field: data[field] for field in ('name', 'email', 'about') if field in data}
+        if 'password' in data:
+            values['hashed_password'] = User.hash_password(data['password'])
 
-            if 'password' in data:
-                user.set_password(data['password'])
+        with session_manager.create_session() as db_sess:
+            new_version = _versioned_update(db_sess, User, user_id, values, expected_version)
+            if new_version is None:
+                db_sess.rollback()
+                if db_sess.get(User, user_id) is None:
+                    return jsonify({'error': 'Пользователь не найден'}), 404
+                return jsonify({'error': 'Пользователь уже изменён, версия устарела'}), 412
 
             db_sess.commit()
-            return jsonify({'message': 'Пользователь обновлён'}), 200
+            response = jsonify({'message': 'Пользователь обновлён'})
+            response.set_etag(str(new_version))
+            return response, 200
 
     except Exception as e:
         return jsonify({'error': f'Ошибка сервера: {str(e)}'}), 500
@@ -436,6 +591,21 @@ def delete_user(user_id):
             if not user:
                 return jsonify({'error': 'Пользователь не найден'}), 404
 
+            # новости остаются без автора, как раньше делал ORM; одним
+            # UPDATE, чтобы не загружать их. Версия растёт, чтобы изменение
+            # попало в журнал синхронизации и сбросило ETag/If-Match
+            db_sess.execute(
+                sa.update(News).where(News.user_id == user_id)
+                .values(user_id=None, version=News.version + 1)
+                .execution_options(synchronize_session=False)
+            )
+            # и архивные тоже: id пользователей SQLite выдаёт повторно, иначе
+            # следующий новый пользователь получил бы чужой архив
+            db_sess.execute(
+                sa.update(ArchivedNews).where(ArchivedNews.user_id == user_id)
+                .values(user_id=None)
+                .execution_options(synchronize_session=False)
+            )
             db_sess.delete(user)
             db_sess.commit()
             return jsonify({'message': 'Пользователь удалён'}), 200
@@ -445,6 +615,7 @@ def delete_user(user_id):
 
 
 @blueprint.route('/api/users', methods=['GET'])
+@limiter.limit('users_list', per_minute=60, burst=20, route_class='heavy')
 def get_all_users():
     """
     Получить всех пользователей
@@ -463,18 +634,22 @@ def get_all_users():
                 properties:
                   id:
                     type: integer
-                  username:
+                  name:
                     type: string
                   email:
                     type: string
                   create_data:
                     type: string
+      429:
+        description: Слишком много запросов от клиента
+      503:
+        description: Сервер перегружен, повторите позже
     """
     with session_manager.create_session() as db_sess:
         users = db_sess.query(User).all()
         return jsonify(
             [
-                user.to_dict(only=('id', 'username', 'email', 'create_data'))
+                user.to_dict(only=('id', 'name', 'email', 'create_data'))
                 for user in users
             ]
         )
@@ -493,6 +668,12 @@ def get_user(user_id):
         required: true
         schema:
           type: integer
+      - name: archive
+        in: query
+        required: false
+        description: 1 — учитывать и новости из архива
+        schema:
+          type: integer
     responses:
       200:
         description: Пользователь найден
@@ -503,7 +684,7 @@ def get_user(user_id):
               properties:
                 id:
                   type: integer
-                username:
+                name:
                   type: string
                 email:
                   type: string
@@ -522,6 +703,9 @@ def get_user(user_id):
                         type: string
                       is_private:
                         type: boolean
+                  description: последние новости пользователя (не больше 5)
+                news_count:
+                  type: integer
       404:
         description: Пользователь не найден
     """
@@ -529,7 +713,340 @@ def get_user(user_id):
         user = db_sess.query(User).get(user_id)
         if not user:
             return make_response(jsonify({'error': 'Not found'}), 404)
-        return jsonify(user.to_dict(
-            only=('id', 'username', 'email', 'create_data'),
-            rels={'news': ('id', 'title', 'content', 'is_private')}
-        ))
+        archive = archive_requested(request.args)
+        preview = _user_news_page(db_sess, user, None, USER_NEWS_PREVIEW, archive)
+        result = user.to_dict(only=('id', 'name', 'email', 'create_data'))
+        result['news'] = [item.to_dict(only=USER_NEWS_FIELDS) for item in preview]
+        result['news_count'] = _count_user_news(db_sess, user_id, archive)
+        response = jsonify(result)
+        response.set_etag(str(user.version))
+        return response
+
+
+@blueprint.route('/api/users/<int:user_id>/news', methods=['GET'])
+def get_user_news(user_id):
+    """
+    Получить новости пользователя постранично
+    ---
+    tags:
+      - User
+    parameters:
+      - name: user_id
+        in: path
+        required: true
+        schema:
+          type: integer
+      - name: cursor
+        in: query
+        required: false
+        description: id последней новости с предыдущей страницы
+        schema:
+          type: integer
+      - name: archive
+        in: query
+        required: false
+        description: 1 — учитывать и новости из архива
+        schema:
+          type: integer
+      - name: limit
+        in: query
+        required: false
+        schema:
+          type: integer
+          default: 20
+          maximum: 100
+    responses:
+      200:
+        description: Страница новостей пользователя (от новых к старым)
+        content:
+          application/json:
+            schema:
+              type: object
+              properties:
+                news:
+                  type: array
+                  items:
+                    type: object
+                    properties:
+                      id:
+                        type: integer
+                      title:
+                        type: string
+                      content:
+                        type: string
+                      is_private:
+                        type: boolean
+                count:
+                  type: integer
+                next_cursor:
+                  type: integer
+                  nullable: true
+      400:
+        description: Некорректные параметры пагинации
+      404:
+        description: Пользователь не найден
+    """
+    cursor = request.args.get('cursor', type=int)
+    limit = request.args.get('limit', USER_NEWS_PAGE_SIZE, type=int)
+    if limit < 1 or limit > USER_NEWS_MAX_PAGE_SIZE:
+        return make_response(jsonify({'error': 'Bad request'}), 400)
+
+    with session_manager.create_session() as db_sess:
+        user = db_sess.get(User, user_id)
+        if not user:
+            return make_response(jsonify({'error': 'Not found'}), 404)
+
+        archive = archive_requested(request.args)
+        page = _user_news_page(db_sess, user, cursor, limit + 1, archive)
+
+        next_cursor = page[limit - 1].id if len(page) > limit else None
+        return jsonify(
+            {
+                'news': [item.to_dict(only=USER_NEWS_FIELDS) for item in page[:limit]],
+                'count': _count_user_news(db_sess, user_id, archive),
+                'next_cursor': next_cursor
+            }
+        )
+
+
+@blueprint.route('/api/admin/stats', methods=['GET'])
+def get_admin_stats():
+    """
+    Статистика новостей для администратора
+    ---
+    tags:
+      - Admin
+    responses:
+      200:
+        description: Агрегированная статистика
+        content:
+          application/json:
+            schema:
+              type: object
+              properties:
+                total:
+                  type: integer
+                private:
+                  type: integer
+                public:
+                  type: integer
+                private_ratio:
+                  type: number
+                authors:
+                  type: array
+                  items:
+                    type: object
+                    properties:
+                      user_id:
+                        type: integer
+                      name:
+                        type: string
+                      total:
+                        type: integer
+                      private:
+                        type: integer
+                daily:
+                  type: array
+                  items:
+                    type: object
+                    properties:
+                      day:
+                        type: string
+                      total:
+                        type: integer
+                      private:
+                        type: integer
+      401:
+        description: Не авторизован
+      403:
+        description: Нет прав администратора
+    """
+    _require_admin()
+    with session_manager.create_session() as db_sess:
+        return jsonify(news_stats.get_dashboard(db_sess))
+
+
+@blueprint.route('/api/admin/profile', methods=['GET'])
+def get_profiling():
+    """
+    Состояние профилирования запросов
+    ---
+    tags:
+      - Admin
+    responses:
+      200:
+        description: Активные сессии профилирования и сохранённые профили
+        content:
+          application/json:
+            schema:
+              type: object
+              properties:
+                sample_rate:
+                  type: number
+                sessions:
+                  type: array
+                  items:
+                    type: object
+                    properties:
+                      endpoint:
+                        type: string
+                      requests:
+                        type: integer
+                      expires:
+                        type: string
+                files:
+                  type: object
+                  description: имена файлов .folded по endpoint, новые первыми
+      401:
+        description: Не авторизован
+      403:
+        description: Нет прав администратора
+    """
+    _require_admin()
+    return jsonify(
+        {
+            'sample_rate': profiler.sample_rate,
+            'sessions': profiler.sessions(),
+            'files': profiler.files()
+        }
+    )
+
+
+@blueprint.route('/api/admin/profile', methods=['POST'])
+def start_profiling():
+    """
+    Включить профилирование запросов к endpoint
+    ---
+    tags:
+      - Admin
+    requestBody:
+      required: true
+      content:
+        application/json:
+          schema:
+            type: object
+            required:
+              - endpoint
+            properties:
+              endpoint:
+                type: string
+                description: имя endpoint Flask, например news_api.get_user или all_news
+              requests:
+                type: integer
+                default: 10
+              seconds:
+                type: integer
+                default: 300
+    responses:
+      200:
+        description: Сессия профилирования открыта; token можно передать в заголовке header, чтобы профилировать свой запрос к любому endpoint
+        content:
+          application/json:
+            schema:
+              type: object
+              properties:
+                session:
+                  type: object
+                header:
+                  type: string
+                token:
+                  type: string
+      400:
+        description: Неизвестный endpoint или некорректные параметры
+      401:
+        description: Не авторизован
+      403:
+        description: Нет прав администратора
+    """
+    _require_admin()
+    data = request.get_json(silent=True) or {}
+    endpoint = data.get('endpoint')
+    requests_count = data.get('requests', 10)
+    seconds = data.get('seconds', 300)
+    if (endpoint not in flask.current_app.view_functions
+            or not isinstance(requests_count, int) or requests_count < 1
+            or not isinstance(seconds, int) or seconds < 1):
+        return make_response(jsonify({'error': 'Bad request'}), 400)
+
+    return jsonify(
+        {
+            'session': profiler.arm(endpoint, requests_count, seconds),
+            'header': profiler.header,
+            'token': profiler.make_token()
+        }
+    )
+
+
+def _require_admin():
+    if not current_user.is_authenticated:
+        abort(401)
+    if not current_user.is_admin():
+        abort(403)
+
+
+def _user_news_page(db_sess, user, cursor, limit, archive=False):
+    """Не больше limit новостей пользователя с id меньше cursor, от новых
+    к старым; с archive — вместе с архивными."""
+    # keyset-пагинация: следующая страница начинается после cursor,
+    # поэтому OFFSET не нужен и глубокие страницы не дорожают
+    stmt = user.news.select().order_by(News.id.desc()).limit(limit)
+    if cursor is not None:
+        stmt = stmt.where(News.id < cursor)
+    page = db_sess.scalars(stmt).all()
+    if not archive:
+        return page
+
+    # id не переиспользуются, поэтому страницы обеих таблиц сливаются по id
+    stmt = (
+        sa.select(ArchivedNews).where(ArchivedNews.user_id == user.id)
+        .order_by(ArchivedNews.id.desc()).limit(limit)
+    )
+    if cursor is not None:
+        stmt = stmt.where(ArchivedNews.id < cursor)
+    page = list(page) + list(db_sess.scalars(stmt))
+    return sorted(page, key=lambda item: item.id, reverse=True)[:limit]
+
+
+def _count_user_news(db_sess, user_id, archive=False):
+    count = db_sess.scalar(
+        sa.select(sa.func.count()).select_from(News).where(News.user_id == user_id)
+    )
+    if archive:
+        count += db_sess.scalar(
+            sa.select(sa.func.count()).select_from(ArchivedNews)
+            .where(ArchivedNews.user_id == user_id)
+        )
+    return count
+
+
+def _if_match_version():
+    """Версия строки из заголовка If-Match или None, если он не передан.
+
+    ValueError, если заголовок есть, но это не одна версия-число.
+    """
+    if_match = request.if_match
+    if not if_match or if_match.star_tag:
+        return None
+    tags = if_match.as_set()
+    if len(tags) != 1:
+        raise ValueError(request.headers.get('If-Match'))
+    return int(tags.pop())
+
+
+def _versioned_update(db_sess, model, obj_id, values, expected_version=None):
+    """Обновление строки одним UPDATE без предварительного SELECT.
+
+    Версия увеличивается в том же запросе; если передан expected_version,
+    строка обновляется только при совпадении версии. Возвращает новую
+    версию или None, если ни одна строка не обновилась.
+    """
+    stmt = (
+        sa.update(model)
+        .where(model.id == obj_id)
+        .values(version=model.version + 1, **values)
+        .returning(model.version)
+        .execution_options(synchronize_session=False)
+    )
+    if expected_version is not None:
+        stmt = stmt.where(model.version == expected_version)
+    return db_sess.execute(stmt).scalar()
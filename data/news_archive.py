@@ -0,0 +1,122 @@
+import datetime
+import zlib
+
+import sqlalchemy
+from sqlalchemy import orm
+from sqlalchemy_serializer import SerializerMixin
+
+from .db_session import SqlAlchemyBase
+from .news import News
+
+# Новости старше этого срока переносятся в архив (flask archive-news)
+ARCHIVE_AFTER_DAYS = 365
+ARCHIVE_BATCH_SIZE = 500
+
+
+class ArchivedNews(SqlAlchemyBase, SerializerMixin):
+    """Холодная часть новостей: старые записи со сжатым текстом.
+
+    Строки переносятся из news с теми же id, доступны только для чтения.
+    """
+    __tablename__ = 'news_archive'
+
+    serialize_rules = ('-content_z',)
+    is_archived = True
+
+    id = sqlalchemy.Column(sqlalchemy.Integer, primary_key=True,
+                           autoincrement=False)
+    title = sqlalchemy.Column(sqlalchemy.String, nullable=True)
+    content_z = sqlalchemy.Column(sqlalchemy.LargeBinary, nullable=True)
+    create_date = sqlalchemy.Column(sqlalchemy.DateTime, index=True)
+    is_private = sqlalchemy.Column(sqlalchemy.Boolean)
+    user_id = sqlalchemy.Column(sqlalchemy.Integer, index=True)
+    version = sqlalchemy.Column(sqlalchemy.Integer, nullable=False, default=1)
+    archived_at = sqlalchemy.Column(sqlalchemy.DateTime,
+                                    default=datetime.datetime.now)
+
+    user = orm.relationship('User',
+                            primaryjoin='foreign(ArchivedNews.user_id) == User.id',
+                            viewonly=True)
+
+    @property
+    def content(self):
+        if self.content_z is None:
+            return None
+        return zlib.decompress(self.content_z).decode('utf-8')
+
+    def __repr__(self):
+        return f'<ArchivedNews: {self.title}>'
+
+
+def install(engine: sqlalchemy.Engine) -> None:
+    """Счётчик AUTOINCREMENT таблицы news не ниже наибольшего id архива.
+
+    Нужно для баз, где id уже выдавались повторно до появления
+    AUTOINCREMENT: иначе новая новость может получить id архивной.
+    """
+    if engine.dialect.name != 'sqlite':
+        return
+
+    with engine.begin() as conn:
+        archived = conn.scalar(sqlalchemy.select(sqlalchemy.func.max(ArchivedNews.id)))
+        if archived is None:
+            return
+        seq = conn.scalar(sqlalchemy.text("SELECT seq FROM sqlite_sequence WHERE name = 'news'"))
+        if seq is None:
+            conn.execute(sqlalchemy.text(
+                "INSERT INTO sqlite_sequence (name, seq) VALUES ('news', :seq)"
+            ), {'seq': archived})
+        elif seq < archived:
+            conn.execute(sqlalchemy.text(
+                "UPDATE sqlite_sequence SET seq = :seq WHERE name = 'news'"
+            ), {'seq': archived})
+
+
+def archive_requested(args) -> bool:
+    """Запрошено ли чтение архива (?archive=1 в параметрах запроса)."""
+    return args.get('archive', '').lower() in ('1', 'true', 'yes')
+
+
+def archive_news(db_sess: orm.Session, older_than: datetime.timedelta,
+                 batch_size: int = ARCHIVE_BATCH_SIZE) -> int:
+    """Перенос новостей старше older_than из news в news_archive.
+
+    Работает пачками, каждая в своей транзакции, поэтому прерванный
+    перенос можно просто запустить снова. Возвращает количество
+    перенесённых новостей.
+    """
+    cutoff = datetime.datetime.now() - older_than
+    moved = 0
+    while True:
+        batch = db_sess.execute(
+            sqlalchemy.select(News.id, News.title, News.content, News.create_date,
+                              News.is_private, News.user_id, News.version)
+            .where(News.create_date < cutoff)
+            .order_by(News.id)
+            .limit(batch_size)
+        ).all()
+        if not batch:
+            return moved
+
+        now = datetime.datetime.now()
+        db_sess.execute(sqlalchemy.insert(ArchivedNews), [
+            {
+                'id': row.id,
+                'title': row.title,
+                'content_z': None if row.content is None
+                else zlib.compress(row.content.encode('utf-8')),
+                'create_date': row.create_date,
+                'is_private': row.is_private,
+                'user_id': row.user_id,
+                'version': row.version,
+                'archived_at': now
+            }
+            for row in batch
+        ])
+        db_sess.execute(
+            sqlalchemy.delete(News)
+            .where(News.id.in_([row.id for row in batch]))
+            .execution_options(synchronize_session=False)
+        )
+        db_sess.commit()
+        moved += len(batch)
@@ -0,0 +1,159 @@
+import datetime
+
+import sqlalchemy
+from sqlalchemy import orm
+
+from .db_session import SqlAlchemyBase
+
+# Сколько хранить записи об удалённых новостях (flask compact-changes)
+TOMBSTONE_RETENTION_DAYS = 30
+CHANGES_PAGE_SIZE = 500
+CHANGES_MAX_PAGE_SIZE = 1000
+
+# Виды изменений: новость создана или изменена, удалена, перенесена в архив
+UPSERT, DELETE, ARCHIVE = 'upsert', 'delete', 'archive'
+
+
+class NewsChange(SqlAlchemyBase):
+    """Журнал изменений новостей для синхронизации клиентов.
+
+    seq растёт монотонно (AUTOINCREMENT не переиспользует номера) и служит
+    токеном синхронизации. Для каждой новости хранится только последнее
+    изменение, поэтому журнал не больше числа новостей плюс удалённые.
+    """
+    __tablename__ = 'news_changes'
+    __table_args__ = {'sqlite_autoincrement': True}
+
+    seq = sqlalchemy.Column(sqlalchemy.Integer, primary_key=True, autoincrement=True)
+    news_id = sqlalchemy.Column(sqlalchemy.Integer, nullable=False, unique=True)
+    op = sqlalchemy.Column(sqlalchemy.String, nullable=False)
+    changed_at = sqlalchemy.Column(sqlalchemy.DateTime, nullable=False, index=True)
+
+
+class SyncState(SqlAlchemyBase):
+    """Граница журнала (одна строка с id = 1).
+
+    horizon — наибольший seq среди удалённых при сжатии записей. Токен
+    синхронизации хранит и seq, и horizon на момент выдачи: если с тех пор
+    граница сдвинулась за seq клиента, он мог пропустить удаление и должен
+    загрузить всё заново.
+    """
+    __tablename__ = 'news_sync_state'
+
+    id = sqlalchemy.Column(sqlalchemy.Integer, primary_key=True)
+    horizon = sqlalchemy.Column(sqlalchemy.Integer, nullable=False, default=0)
+
+
+def parse_token(token: str):
+    """Токен синхронизации 'seq:horizon' -> (seq, horizon); ValueError,
+    если токен некорректный."""
+    seq, horizon = (int(part) for part in token.split(':'))
+    if seq < 0 or horizon < 0:
+        raise ValueError(token)
+    return seq, horizon
+
+
+def make_token(seq: int, horizon: int) -> str:
+    return f'{seq}:{horizon}'
+
+
+def _record(row: str, op: str) -> str:
+    return f"""
+        DELETE FROM news_changes WHERE news_id = {row}.id;
+        INSERT INTO news_changes (news_id, op, changed_at)
+        VALUES ({row}.id, {op}, datetime('now', 'localtime'));
+    """
+
+
+# Как и агрегаты в news_stats, журнал ведут триггеры: любое изменение
+# новости (ORM, UPDATE по версии, удаление, архивация) попадает в него
+# в той же транзакции. Изменение новости — это всегда смена версии.
+TRIGGERS = {
+    'news_changes_insert': f"""
+        CREATE TRIGGER news_changes_insert AFTER INSERT ON news
+        BEGIN {_record('NEW', f"'{UPSERT}'")} END
+    """,
+    'news_changes_update': f"""
+        CREATE TRIGGER news_changes_update AFTER UPDATE OF version ON news
+        WHEN NEW.version IS NOT OLD.version
+        BEGIN {_record('NEW', f"'{UPSERT}'")} END
+    """,
+    'news_changes_delete': f"""
+        CREATE TRIGGER news_changes_delete AFTER DELETE ON news
+        BEGIN {_record('OLD', f'''
+            CASE WHEN EXISTS (SELECT 1 FROM news_archive WHERE id = OLD.id)
+                 THEN '{ARCHIVE}' ELSE '{DELETE}' END''')} END
+    """,
+}
+
+
+def install(engine: sqlalchemy.Engine) -> None:
+    """Создание триггеров; при первом запуске в журнал попадают все
+    существующие новости."""
+    from .news import News
+
+    if engine.dialect.name != 'sqlite':
+        print("[WARN] Журнал изменений поддерживается только для SQLite, триггеры не созданы.")
+        return
+
+    with engine.begin() as conn:
+        for name, ddl in TRIGGERS.items():
+            conn.execute(sqlalchemy.text(f'DROP TRIGGER IF EXISTS {name}'))
+            conn.execute(sqlalchemy.text(ddl))
+
+        if conn.scalar(sqlalchemy.select(SyncState.id)) is None:
+            conn.execute(sqlalchemy.insert(SyncState).values(id=1, horizon=0))
+            conn.execute(sqlalchemy.insert(NewsChange).from_select(
+                ['news_id', 'op', 'changed_at'],
+                sqlalchemy.select(News.id, sqlalchemy.literal(UPSERT),
+                                  sqlalchemy.literal(datetime.datetime.now()))
+                .order_by(News.id)
+            ))
+
+
+def get_changes(db_sess: orm.Session, token: str = None, limit: int = CHANGES_PAGE_SIZE):
+    """Изменения после токена (без токена — все новости), не больше limit.
+
+    Возвращает (изменения, новости по id, есть ли ещё, следующий токен)
+    или None, если токен устарел и нужна полная синхронизация.
+    ValueError, если токен некорректный.
+    """
+    from .news import News
+
+    since, token_horizon = parse_token(token) if token else (0, 0)
+    horizon = db_sess.scalar(sqlalchemy.select(SyncState.horizon))
+    if token and horizon > token_horizon and since < horizon:
+        return None
+
+    changes = db_sess.scalars(
+        sqlalchemy.select(NewsChange).where(NewsChange.seq > since)
+        .order_by(NewsChange.seq).limit(limit + 1)
+    ).all()
+    has_more = len(changes) > limit
+    changes = changes[:limit]
+
+    ids = [change.news_id for change in changes if change.op == UPSERT]
+    news = {item.id: item for item in
+            db_sess.scalars(sqlalchemy.select(News).where(News.id.in_(ids)))}
+    next_token = make_token(changes[-1].seq if changes else since, horizon)
+    return changes, news, has_more, next_token
+
+
+def compact(db_sess: orm.Session, older_than: datetime.timedelta) -> int:
+    """Удаление записей об удалениях старше older_than со сдвигом границы
+    журнала. Возвращает число удалённых записей."""
+    cutoff = datetime.datetime.now() - older_than
+    tombstones = sqlalchemy.and_(NewsChange.op != UPSERT, NewsChange.changed_at < cutoff)
+
+    purged_seq = db_sess.scalar(sqlalchemy.select(sqlalchemy.func.max(NewsChange.seq))
+                                .where(tombstones))
+    if purged_seq is None:
+        return 0
+
+    deleted = db_sess.execute(sqlalchemy.delete(NewsChange).where(tombstones)).rowcount
+    db_sess.execute(
+        sqlalchemy.update(SyncState).where(SyncState.id == 1)
+        .values(horizon=sqlalchemy.func.max(SyncState.horizon, purged_seq))
+    )
+    db_sess.commit()
+    return deleted
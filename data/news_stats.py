@@ -0,0 +1,204 @@
+import datetime
+
+import sqlalchemy
+from sqlalchemy import orm
+
+from .db_session import SqlAlchemyBase
+
+# Сколько авторов и дней показывать на панели администратора
+TOP_AUTHORS = 10
+DAILY_DAYS = 30
+
+
+class NewsTotals(SqlAlchemyBase):
+    """Общие счётчики новостей (одна строка с id = 1)."""
+    __tablename__ = 'news_stats_totals'
+
+    id = sqlalchemy.Column(sqlalchemy.Integer, primary_key=True)
+    total = sqlalchemy.Column(sqlalchemy.Integer, nullable=False, default=0)
+    private_count = sqlalchemy.Column(sqlalchemy.Integer, nullable=False, default=0)
+
+
+class UserNewsStats(SqlAlchemyBase):
+    """Число новостей каждого автора."""
+    __tablename__ = 'news_stats_users'
+
+    user_id = sqlalchemy.Column(sqlalchemy.Integer, primary_key=True)
+    total = sqlalchemy.Column(sqlalchemy.Integer, nullable=False, default=0,
+                              index=True)
+    private_count = sqlalchemy.Column(sqlalchemy.Integer, nullable=False, default=0)
+
+    user = orm.relationship('User',
+                            primaryjoin='foreign(UserNewsStats.user_id) == User.id',
+                            viewonly=True)
+
+
+class DailyNewsStats(SqlAlchemyBase):
+    """Число новостей по дням создания."""
+    __tablename__ = 'news_stats_daily'
+
+    day = sqlalchemy.Column(sqlalchemy.Date, primary_key=True)
+    total = sqlalchemy.Column(sqlalchemy.Integer, nullable=False, default=0)
+    private_count = sqlalchemy.Column(sqlalchemy.Integer, nullable=False, default=0)
+
+
+def _apply(row: str, sign: str) -> str:
+    """SQL, прибавляющий (sign='+') или вычитающий (sign='-') строку news
+    (row = NEW или OLD) из всех агрегатов."""
+    private = f'coalesce({row}.is_private, 0)'
+    return f"""
+        INSERT INTO news_stats_totals (id, total, private_count)
+        VALUES (1, {sign}1, {sign}{private})
+        ON CONFLICT (id) DO UPDATE SET
+            total = total + excluded.total,
+            private_count = private_count + excluded.private_count;
+        INSERT INTO news_stats_users (user_id, total, private_count)
+        SELECT {row}.user_id, {sign}1, {sign}{private} WHERE {row}.user_id IS NOT NULL
+        ON CONFLICT (user_id) DO UPDATE SET
+            total = total + excluded.total,
+            private_count = private_count + excluded.private_count;
+        INSERT INTO news_stats_daily (day, total, private_count)
+        SELECT date({row}.create_date), {sign}1, {sign}{private}
+        WHERE {row}.create_date IS NOT NULL
+        ON CONFLICT (day) DO UPDATE SET
+            total = total + excluded.total,
+            private_count = private_count + excluded.private_count;
+    """
+
+
+# Триггеры обновляют агрегаты в той же транзакции, что и саму новость,
+# поэтому их не обходит ни ORM, ни прямые UPDATE/DELETE-запросы.
+TRIGGERS = {
+    'news_stats_insert': f"""
+        CREATE TRIGGER news_stats_insert AFTER INSERT ON news
+        BEGIN {_apply('NEW', '+')} END
+    """,
+    # перенос в архив (news_archive) — не удаление, счётчики не меняются
+    'news_stats_delete': f"""
+        CREATE TRIGGER news_stats_delete AFTER DELETE ON news
+        WHEN NOT EXISTS (SELECT 1 FROM news_archive WHERE id = OLD.id)
+        BEGIN {_apply('OLD', '-')} END
+    """,
+    'news_stats_update': f"""
+        CREATE TRIGGER news_stats_update
+        AFTER UPDATE OF user_id, is_private, create_date ON news
+        WHEN OLD.user_id IS NOT NEW.user_id
+          OR OLD.is_private IS NOT NEW.is_private
+          OR OLD.create_date IS NOT NEW.create_date
+        BEGIN {_apply('OLD', '-')} {_apply('NEW', '+')} END
+    """,
+    # архивные новости тоже входят в агрегаты; меняется у них только автор
+    # (при удалении пользователя)
+    'news_stats_archive_update': f"""
+        CREATE TRIGGER news_stats_archive_update
+        AFTER UPDATE OF user_id, is_private, create_date ON news_archive
+        WHEN OLD.user_id IS NOT NEW.user_id
+          OR OLD.is_private IS NOT NEW.is_private
+          OR OLD.create_date IS NOT NEW.create_date
+        BEGIN {_apply('OLD', '-')} {_apply('NEW', '+')} END
+    """,
+}
+
+
+def install(engine: sqlalchemy.Engine) -> None:
+    """Создание триггеров; при первом запуске агрегаты считаются с нуля."""
+    if engine.dialect.name != 'sqlite':
+        print("[WARN] Агрегаты новостей поддерживаются только для SQLite, триггеры не созданы.")
+        return
+
+    with engine.begin() as conn:
+        for name, ddl in TRIGGERS.items():
+            conn.execute(sqlalchemy.text(f'DROP TRIGGER IF EXISTS {name}'))
+            conn.execute(sqlalchemy.text(ddl))
+
+        if conn.scalar(sqlalchemy.select(NewsTotals.id)) is None:
+            _recompute(conn)
+
+
+def recompute(db_sess: orm.Session) -> None:
+    """Полный пересчёт агрегатов по news и news_archive (для починки)."""
+    _recompute(db_sess.connection())
+    db_sess.commit()
+
+
+def _recompute(conn: sqlalchemy.Connection) -> None:
+    from .news import News
+    from .news_archive import ArchivedNews
+
+    rows = sqlalchemy.union_all(
+        sqlalchemy.select(News.user_id, News.is_private, News.create_date),
+        sqlalchemy.select(ArchivedNews.user_id, ArchivedNews.is_private,
+                          ArchivedNews.create_date)
+    ).subquery()
+    private = sqlalchemy.func.coalesce(sqlalchemy.func.sum(
+        sqlalchemy.cast(sqlalchemy.func.coalesce(rows.c.is_private, False), sqlalchemy.Integer)
+    ), 0)
+    day = sqlalchemy.func.date(rows.c.create_date)
+
+    for model in (NewsTotals, UserNewsStats, DailyNewsStats):
+        conn.execute(sqlalchemy.delete(model))
+
+    conn.execute(sqlalchemy.insert(NewsTotals).from_select(
+        ['id', 'total', 'private_count'],
+        sqlalchemy.select(sqlalchemy.literal(1), sqlalchemy.func.count(), private)
+        .select_from(rows)
+    ))
+    conn.execute(sqlalchemy.insert(UserNewsStats).from_select(
+        ['user_id', 'total', 'private_count'],
+        sqlalchemy.select(rows.c.user_id, sqlalchemy.func.count(), private)
+        .where(rows.c.user_id.is_not(None))
+        .group_by(rows.c.user_id)
+    ))
+    conn.execute(sqlalchemy.insert(DailyNewsStats).from_select(
+        ['day', 'total', 'private_count'],
+        sqlalchemy.select(day, sqlalchemy.func.count(), private)
+        .where(rows.c.create_date.is_not(None))
+        .group_by(day)
+    ))
+
+
+def get_dashboard(db_sess: orm.Session) -> dict:
+    """Данные для панели администратора.
+
+    Читаются только готовые агрегаты: одна строка итогов, TOP_AUTHORS
+    авторов по индексу и DAILY_DAYS последних дней по первичному ключу,
+    поэтому время не зависит от количества новостей.
+    """
+    totals = db_sess.get(NewsTotals, 1)
+    total = totals.total if totals else 0
+    private_count = totals.private_count if totals else 0
+
+    authors = db_sess.query(UserNewsStats).options(
+        orm.joinedload(UserNewsStats.user)
+    ).filter(UserNewsStats.total > 0).order_by(
+        UserNewsStats.total.desc()
+    ).limit(TOP_AUTHORS).all()
+
+    since = datetime.date.today() - datetime.timedelta(days=DAILY_DAYS - 1)
+    days = db_sess.query(DailyNewsStats).filter(
+        DailyNewsStats.day >= since, DailyNewsStats.total > 0
+    ).order_by(DailyNewsStats.day).all()
+
+    return {
+        'total': total,
+        'private': private_count,
+        'public': total - private_count,
+        'private_ratio': private_count / total if total else 0.0,
+        'authors': [
+            {
+                'user_id': item.user_id,
+                'name': item.user.name if item.user else None,
+                'total': item.total,
+                'private': item.private_count
+            }
+            for item in authors
+        ],
+        'daily': [
+            {
+                'day': item.day.isoformat(),
+                'total': item.total,
+                'private': item.private_count
+            }
+            for item in days
+        ]
+    }
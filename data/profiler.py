@@ -0,0 +1,185 @@
+import collections
+import contextlib
+import datetime
+import os
+import random
+import sys
+import threading
+import time
+from typing import Dict, Optional
+
+import flask
+from itsdangerous import BadSignature, TimestampSigner
+
+
+class StackSampler(threading.Thread):
+    """Статистический профилировщик одного потока.
+
+    Сразу после запуска и затем раз в interval секунд снимает стек целевого
+    потока через sys._current_frames() и считает одинаковые стеки. Целевой
+    поток при этом не трассируется, поэтому замедляется только на время
+    снятия стека.
+    """
+
+    def __init__(self, thread_id: int, interval: float):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = collections.Counter()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        # первый стек снимается сразу, чтобы у запросов короче interval был профиль
+        while self._sample() and not self._stop_event.wait(self.interval):
+            pass
+
+    def _sample(self) -> bool:
+        frame = sys._current_frames().get(self.thread_id)
+        if frame is None:
+            return False
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:'
+                         f'{code.co_firstlineno})')
+            frame = frame.f_back
+        self.stacks[';'.join(reversed(stack))] += 1
+        return True
+
+    def stop(self) -> collections.Counter:
+        self._stop_event.set()
+        self.join()
+        return self.stacks
+
+
+class Profiler:
+    """Профилирование отдельных запросов на работающем сервере.
+
+    Запрос профилируется, если:
+      * он попал в случайную выборку PROFILE_SAMPLE_RATE (0 — никогда);
+      * у него есть заголовок PROFILE_HEADER с подписанным токеном
+        (см. make_token), действующим PROFILE_TOKEN_MAX_AGE секунд;
+      * для его endpoint администратор открыл сессию профилирования (arm).
+
+    Результат — файл со свёрнутыми стеками (формат flamegraph.pl и
+    speedscope) в PROFILE_DIR/<endpoint>/; для каждого endpoint хранится
+    не больше PROFILE_KEEP последних файлов.
+    """
+
+    def __init__(self):
+        self.sample_rate = 0.0
+        self.directory = 'profiles'
+        self.interval = 0.005
+        self.keep = 20
+        self.header = 'X-Profile'
+        self.token_max_age = 3600
+        self._signer: Optional[TimestampSigner] = None
+        self._sessions: Dict[str, list] = {}
+        self._lock = threading.Lock()
+
+    def init_app(self, app: flask.Flask) -> None:
+        self.sample_rate = app.config.setdefault('PROFILE_SAMPLE_RATE', 0.0)
+        self.directory = app.config.setdefault('PROFILE_DIR', 'profiles')
+        self.interval = app.config.setdefault('PROFILE_INTERVAL', 0.005)
+        self.keep = app.config.setdefault('PROFILE_KEEP', 20)
+        self.header = app.config.setdefault('PROFILE_HEADER', 'X-Profile')
+        self.token_max_age = app.config.setdefault('PROFILE_TOKEN_MAX_AGE', 3600)
+        self._signer = TimestampSigner(app.config['SECRET_KEY'], salt='profiler')
+        app.before_request(self._start)
+        app.teardown_request(self._finish)
+
+    def make_token(self) -> str:
+        """Токен для заголовка PROFILE_HEADER."""
+        return self._signer.sign('profile').decode()
+
+    def arm(self, endpoint: str, requests: int, seconds: float) -> dict:
+        """Профилировать следующие requests запросов к endpoint в течение
+        seconds секунд."""
+        expires = time.time() + seconds
+        with self._lock:
+            self._sessions[endpoint] = [requests, expires]
+        return {'endpoint': endpoint, 'requests': requests,
+                'expires': datetime.datetime.fromtimestamp(expires).isoformat()}
+
+    def sessions(self) -> list:
+        now = time.time()
+        with self._lock:
+            return [
+                {'endpoint': endpoint, 'requests': left,
+                 'expires': datetime.datetime.fromtimestamp(expires).isoformat()}
+                for endpoint, (left, expires) in self._sessions.items() if expires > now
+            ]
+
+    def files(self) -> dict:
+        """Сохранённые профили: {endpoint: [имена файлов, новые первыми]}."""
+        if not os.path.isdir(self.directory):
+            return {}
+        return {
+            endpoint: sorted(os.listdir(os.path.join(self.directory, endpoint)), reverse=True)
+            for endpoint in sorted(os.listdir(self.directory))
+            if os.path.isdir(os.path.join(self.directory, endpoint))
+        }
+
+    def _selected(self) -> bool:
+        if self.sample_rate and random.random() < self.sample_rate:
+            return True
+
+        token = flask.request.headers.get(self.header)
+        if token:
+            # неверный или просроченный токен — как его отсутствие
+            with contextlib.suppress(BadSignature):
+                self._signer.unsign(token, max_age=self.token_max_age)
+                return True
+
+        if self._sessions:
+            with self._lock:
+                session = self._sessions.get(flask.request.endpoint)
+                if session is None:
+                    return False
+                if session[1] < time.time():
+                    del self._sessions[flask.request.endpoint]
+                    return False
+                session[0] -= 1
+                if session[0] <= 0:
+                    del self._sessions[flask.request.endpoint]
+                return True
+        return False
+
+    def _start(self):
+        # при нулевой выборке без заголовка и сессий — только эти проверки
+        if not (self.sample_rate or self._sessions or self.header in flask.request.headers):
+            return
+        if flask.request.endpoint is None or not self._selected():
+            return
+        sampler = StackSampler(threading.get_ident(), self.interval)
+        flask.g.profile_sampler = sampler
+        flask.g.profile_started = time.perf_counter()
+        sampler.start()
+
+    def _finish(self, _):
+        sampler = flask.g.pop('profile_sampler', None)
+        if sampler is None:
+            return
+        stacks = sampler.stop()
+        elapsed = time.perf_counter() - flask.g.pop('profile_started')
+        # пустые профили не сохраняем: они вытеснили бы настоящие из PROFILE_KEEP
+        if stacks:
+            self._save(flask.request.endpoint, stacks, elapsed)
+
+    def _save(self, endpoint: str, stacks: collections.Counter, elapsed: float) -> None:
+        directory = os.path.join(self.directory, endpoint)
+        os.makedirs(directory, exist_ok=True)
+        name = f'{datetime.datetime.now():%Y%m%d-%H%M%S-%f}-{elapsed * 1000:.0f}ms.folded'
+        with open(os.path.join(directory, name), 'w', encoding='utf-8') as file:
+            for stack, count in stacks.most_common():
+                file.write(f'{stack} {count}\n')
+
+        old = sorted(os.listdir(directory), reverse=True)[self.keep:]
+        for name in old:
+            # файл мог уже удалить параллельный запрос
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(os.path.join(directory, name))
+
+
+# Экземпляр-синглтон
+profiler = Profiler()
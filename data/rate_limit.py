@@ -0,0 +1,210 @@
+import functools
+import hashlib
+import struct
+import threading
+import time
+from typing import Callable, Dict, Optional, Tuple
+
+import flask
+from werkzeug.exceptions import ServiceUnavailable, TooManyRequests
+
+
+class MemoryBackend:
+    """Token bucket в памяти процесса.
+
+    Каждый бакет хранится одним кортежем (tokens, updated_at, full_at);
+    бакеты, которые успели наполниться, раз в evict_interval секунд
+    удаляются, поэтому словарь не растёт от разовых клиентов.
+    """
+
+    def __init__(self, evict_interval: float = 60.0):
+        self._buckets: Dict[str, Tuple[float, float, float]] = {}
+        self._lock = threading.Lock()
+        self._evict_interval = evict_interval
+        self._next_eviction = time.monotonic() + evict_interval
+
+    def take(self, key: str, rate: float, burst: float) -> float:
+        """Забрать один токен. Возвращает 0, если запрос разрешён, иначе
+        через сколько секунд появится следующий токен."""
+        now = time.monotonic()
+        with self._lock:
+            if now >= self._next_eviction:
+                self._evict(now)
+
+            tokens, updated_at, _ = self._buckets.get(key, (burst, now, now))
+            tokens = min(burst, tokens + (now - updated_at) * rate)
+            if tokens < 1:
+                return (1 - tokens) / rate
+            tokens -= 1
+            self._buckets[key] = (tokens, now, now + (burst - tokens) / rate)
+            return 0.0
+
+    def _evict(self, now: float) -> None:
+        self._buckets = {key: bucket for key, bucket in self._buckets.items()
+                         if bucket[2] > now}
+        self._next_eviction = now + self._evict_interval
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class SharedMemoryBackend:
+    """Token bucket в разделяемой памяти, общий для всех процессов-воркеров.
+
+    Таблица фиксированного размера: слот = (хэш ключа, tokens, updated_at),
+    поиск слота — открытой адресацией. Наполнившиеся бакеты не удаляются
+    отдельно, их слоты просто занимаются заново. Доступ между процессами
+    сериализуется через flock на файле блокировки (только POSIX).
+    """
+
+    SLOT = struct.Struct('<Qdd')
+    PROBES = 8
+
+    def __init__(self, name: str = 'apitest_ratelimit', slots: int = 65536):
+        import fcntl
+        from multiprocessing import resource_tracker, shared_memory
+
+        self._fcntl = fcntl
+        self._slots = slots
+        size = slots * self.SLOT.size
+        try:
+            self._shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            self._shm = shared_memory.SharedMemory(name=name)
+            if self._shm.size < size:
+                raise ValueError(f'Сегмент {name} меньше, чем нужно для {slots} слотов.')
+        # сегмент живёт дольше любого из воркеров, поэтому не даём
+        # resource_tracker удалить его при выходе процесса
+        resource_tracker.unregister(self._shm._name, 'shared_memory')
+
+        self._lock_file = open(f'/tmp/{name}.lock', 'a+b')
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _hash(key: str) -> int:
+        digest = hashlib.blake2b(key.encode(), digest_size=8).digest()
+        return int.from_bytes(digest, 'little') or 1
+
+    def take(self, key: str, rate: float, burst: float) -> float:
+        key_hash = self._hash(key)
+        now = time.time()
+        buf = self._shm.buf
+        with self._lock:
+            self._fcntl.flock(self._lock_file, self._fcntl.LOCK_EX)
+            try:
+                offset = self._find_slot(buf, key_hash, rate, burst, now)
+                stored_hash, tokens, updated_at = self.SLOT.unpack_from(buf, offset)
+                if stored_hash != key_hash:
+                    tokens, updated_at = burst, now
+                tokens = min(burst, tokens + max(0.0, now - updated_at) * rate)
+                if tokens < 1:
+                    return (1 - tokens) / rate
+                self.SLOT.pack_into(buf, offset, key_hash, tokens - 1, now)
+                return 0.0
+            finally:
+                self._fcntl.flock(self._lock_file, self._fcntl.LOCK_UN)
+
+    def _find_slot(self, buf, key_hash: int, rate: float, burst: float, now: float) -> int:
+        """Слот ключа, либо пустой/наполнившийся слот, либо самый старый
+        из просмотренных."""
+        start = key_hash % self._slots
+        free = oldest = None
+        oldest_at = float('inf')
+        for probe in range(self.PROBES):
+            offset = ((start + probe) % self._slots) * self.SLOT.size
+            stored_hash, tokens, updated_at = self.SLOT.unpack_from(buf, offset)
+            if stored_hash == key_hash:
+                return offset
+            if free is None and (
+                    stored_hash == 0 or tokens + (now - updated_at) * rate >= burst):
+                free = offset
+            if updated_at < oldest_at:
+                oldest, oldest_at = offset, updated_at
+        return free if free is not None else oldest
+
+    def close(self) -> None:
+        self._shm.close()
+        self._lock_file.close()
+
+
+class RateLimiter:
+    """Ограничение частоты запросов и числа одновременных запросов к маршрутам.
+
+    Настройки приложения:
+        RATELIMIT_ENABLED      — включить ограничения (по умолчанию True);
+        RATELIMIT_STORAGE      — 'memory' или 'shm' (общий для процессов);
+        RATELIMIT_SHM_NAME, RATELIMIT_SHM_SLOTS — параметры сегмента 'shm';
+        RATELIMIT_CONCURRENCY  — {класс маршрута: максимум одновременных запросов}.
+    """
+
+    def __init__(self):
+        self.enabled = True
+        self.backend = MemoryBackend()
+        self._concurrency: Dict[str, threading.BoundedSemaphore] = {}
+
+    def init_app(self, app: flask.Flask) -> None:
+        self.enabled = app.config.setdefault('RATELIMIT_ENABLED', True)
+        storage = app.config.setdefault('RATELIMIT_STORAGE', 'memory')
+        if storage == 'shm':
+            self.backend = SharedMemoryBackend(
+                app.config.setdefault('RATELIMIT_SHM_NAME', 'apitest_ratelimit'),
+                app.config.setdefault('RATELIMIT_SHM_SLOTS', 65536)
+            )
+        elif storage == 'memory':
+            self.backend = MemoryBackend()
+        else:
+            raise ValueError(f'Неизвестное хранилище RATELIMIT_STORAGE: {storage}')
+
+        limits = app.config.setdefault('RATELIMIT_CONCURRENCY', {'auth': 4, 'heavy': 8})
+        self._concurrency = {name: threading.BoundedSemaphore(value)
+                             for name, value in limits.items()}
+
+    @staticmethod
+    def identity() -> str:
+        """Кто делает запрос: id пользователя из сессии или IP-адрес.
+
+        current_user не используется, чтобы не загружать пользователя из БД
+        для запроса, который может быть отклонён.
+        """
+        user_id = flask.session.get('_user_id')
+        if user_id is not None:
+            return f'user:{user_id}'
+        return f'ip:{flask.request.remote_addr}'
+
+    def limit(self, name: str, per_minute: float, burst: int,
+              route_class: Optional[str] = None,
+              methods: Tuple[str, ...] = ('GET', 'POST', 'PUT', 'DELETE')) -> Callable:
+        """Декоратор маршрута: не больше per_minute запросов в минуту с
+        всплеском до burst от одного клиента и не больше лимита класса
+        route_class одновременно. Проверки выполняются до вызова маршрута.
+        HEAD ограничивается как GET: Flask выполняет для него тот же маршрут."""
+        rate = per_minute / 60
+
+        def decorator(view):
+            @functools.wraps(view)
+            def wrapper(*args, **kwargs):
+                method = 'GET' if flask.request.method == 'HEAD' else flask.request.method
+                if not self.enabled or method not in methods:
+                    return view(*args, **kwargs)
+
+                retry_after = self.backend.take(f'{name}:{self.identity()}', rate, burst)
+                if retry_after:
+                    raise TooManyRequests(retry_after=int(retry_after) + 1)
+
+                semaphore = self._concurrency.get(route_class)
+                if semaphore is None:
+                    return view(*args, **kwargs)
+                if not semaphore.acquire(blocking=False):
+                    raise ServiceUnavailable(retry_after=1)
+                try:
+                    return view(*args, **kwargs)
+                finally:
+                    semaphore.release()
+
+            return wrapper
+
+        return decorator
+
+
+# Экземпляр-синглтон
+limiter = RateLimiter()
@@ -25,9 +25,19 @@ class User(SqlAlchemyBase, UserMixin, SerializerMixin):
                                         nullable=True)
     level = sqlalchemy.Column(sqlalchemy.Integer, default=1)
     create_data = sqlalchemy.Column(sqlalchemy.DateTime,
-                                    default=datetime.datetime.now())
+                                    default=datetime.datetime.now)
+    # версия строки (version_id_col), как и у News
+    version = sqlalchemy.Column(sqlalchemy.Integer,
+                                nullable=False, default=1,
+                                server_default='1')
 
-    news = orm.relationship("News", back_populates='user')
+    __mapper_args__ = {'version_id_col': version}
+
+    # write_only: связь никогда не загружается целиком, только через
+    # user.news.select() с явными limit/where. passive_deletes: при удалении
+    # пользователя ORM не загружает его новости (их отвязывает delete_user)
+    news = orm.relationship("News", back_populates='user', lazy='write_only',
+                            passive_deletes=True)
 
     def set_username(self, newname):
         self.name = newname
@@ -36,7 +46,11 @@ class User(SqlAlchemyBase, UserMixin, SerializerMixin):
         return f'<User: {self.name}>'
 
     def set_password(self, password):
-        self.hashed_password = generate_password_hash(password)
+        self.hashed_password = self.hash_password(password)
+
+    @staticmethod
+    def hash_password(password):
+        return generate_password_hash(password)
 
     def check_password(self, password):
         return check_password_hash(self.hashed_password, password)
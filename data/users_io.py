@@ -0,0 +1,189 @@
+import csv
+import itertools
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Iterable, Iterator, Optional, TextIO
+
+import sqlalchemy
+from sqlalchemy import orm
+
+from .users import User
+
+IMPORT_CHUNK_SIZE = 1000
+EXPORT_FIELDS = ('id', 'name', 'email', 'about', 'create_data')
+
+
+@dataclass
+class ImportResult:
+    imported: int = 0
+    duplicates: int = 0
+    invalid: int = 0
+    skipped: int = 0
+    seconds: float = 0.0
+
+    @property
+    def rate(self) -> float:
+        """Импортировано пользователей в секунду."""
+        return self.imported / self.seconds if self.seconds else 0.0
+
+
+def detect_format(path: str) -> str:
+    return 'csv' if path.lower().endswith('.csv') else 'ndjson'
+
+
+def read_users(stream: TextIO, fmt: str) -> Iterator[Optional[dict]]:
+    """Построчное чтение пользователей из CSV (с заголовком) или NDJSON.
+
+    Вместо строки NDJSON, которая не разбирается или не является объектом,
+    возвращается None: import_users считает её некорректной записью.
+    """
+    if fmt == 'csv':
+        yield from csv.DictReader(stream)
+        return
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            record = None
+        yield record if isinstance(record, dict) else None
+
+
+def import_users(db_sess: orm.Session, records: Iterable[dict],
+                 chunk_size: int = IMPORT_CHUNK_SIZE,
+                 workers: Optional[int] = None,
+                 checkpoint: Optional[str] = None,
+                 progress=None) -> ImportResult:
+    """Массовое создание пользователей.
+
+    Записи обрабатываются пачками по chunk_size: дубликаты email ищутся
+    одним запросом на пачку по уникальному индексу, пароли хэшируются в
+    пуле из workers процессов, пачка вставляется одной транзакцией. После
+    каждой пачки в файл checkpoint пишется число обработанных записей,
+    и повторный запуск продолжает с этого места (пачка, оборванная между
+    commit и записью checkpoint, при повторе отсеется как дубликаты).
+    """
+    result = ImportResult()
+    workers = workers or os.cpu_count() or 1
+    done = _read_checkpoint(checkpoint)
+    if done:
+        records = itertools.islice(records, done, None)
+        result.skipped = done
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        records = iter(records)
+        while chunk := list(itertools.islice(records, chunk_size)):
+            _import_chunk(db_sess, chunk, pool, workers, result)
+            done += len(chunk)
+            _write_checkpoint(checkpoint, done)
+            result.seconds = time.perf_counter() - start
+            if progress:
+                progress(done, result)
+
+    if checkpoint and os.path.exists(checkpoint):
+        os.remove(checkpoint)
+    return result
+
+
+def _import_chunk(db_sess: orm.Session, chunk: list, pool: ProcessPoolExecutor,
+                  workers: int, result: ImportResult) -> None:
+    valid = {}
+    for record in chunk:
+        if not _is_valid(record):
+            result.invalid += 1
+            continue
+        email = record['email'].strip()
+        if not email:
+            result.invalid += 1
+        elif email in valid:
+            result.duplicates += 1
+        else:
+            valid[email] = record
+
+    existing = set(db_sess.scalars(
+        sqlalchemy.select(User.email).where(User.email.in_(list(valid)))
+    ))
+    for email in existing:
+        del valid[email]
+    result.duplicates += len(existing)
+    if not valid:
+        return
+
+    passwords = [record['password'] for record in valid.values()]
+    hashes = pool.map(User.hash_password, passwords,
+                      chunksize=max(1, len(passwords) // (workers * 4)))
+    db_sess.execute(sqlalchemy.insert(User), [
+        {
+            'name': record['name'],
+            'email': email,
+            'about': record.get('about'),
+            'hashed_password': hashed
+        }
+        for (email, record), hashed in zip(valid.items(), hashes)
+    ])
+    db_sess.commit()
+    result.imported += len(valid)
+
+
+def _is_valid(record) -> bool:
+    """Запись — объект с непустыми строками name, email, password
+    и строкой about (или без неё)."""
+    if not isinstance(record, dict):
+        return False
+    if not all(isinstance(record.get(field), str) and record[field]
+               for field in ('name', 'email', 'password')):
+        return False
+    return record.get('about') is None or isinstance(record['about'], str)
+
+
+def _read_checkpoint(path: Optional[str]) -> int:
+    if not path or not os.path.exists(path):
+        return 0
+    with open(path) as file:
+        return int(file.read().strip() or 0)
+
+
+def _write_checkpoint(path: Optional[str], done: int) -> None:
+    if not path:
+        return
+    tmp = f'{path}.tmp'
+    with open(tmp, 'w') as file:
+        file.write(str(done))
+    os.replace(tmp, path)
+
+
+def export_users(db_sess: orm.Session, stream: TextIO, fmt: str,
+                 batch_size: int = IMPORT_CHUNK_SIZE) -> int:
+    """Потоковая выгрузка пользователей (без хэшей паролей).
+
+    Строки читаются курсором по batch_size и сразу пишутся в stream,
+    поэтому память не зависит от числа пользователей.
+    """
+    columns = [getattr(User, field) for field in EXPORT_FIELDS]
+    rows = db_sess.execute(
+        sqlalchemy.select(*columns).order_by(User.id)
+        .execution_options(yield_per=batch_size)
+    )
+
+    writer = None
+    if fmt == 'csv':
+        writer = csv.writer(stream, lineterminator='\n')
+        writer.writerow(EXPORT_FIELDS)
+
+    count = 0
+    for row in rows:
+        if writer:
+            writer.writerow(row)
+        else:
+            record = row._asdict()
+            if record['create_data'] is not None:
+                record['create_data'] = record['create_data'].isoformat()
+            stream.write(json.dumps(record, ensure_ascii=False) + '\n')
+        count += 1
+    return count
@@ -1,10 +1,14 @@
 from flask_wtf import FlaskForm
+from wtforms.fields.numeric import IntegerField
 from wtforms.fields.simple import StringField, TextAreaField, BooleanField, SubmitField
-from wtforms.validators import DataRequired
+from wtforms.validators import DataRequired, Optional
+from wtforms.widgets import HiddenInput
 
 
 class NewsForm(FlaskForm):
     title = StringField('Заголовок', validators=[DataRequired('Введите заголовок')])
     content = TextAreaField('Содержание')
     is_private = BooleanField('Личное')
+    # версия новости, которую открыли для редактирования
+    version = IntegerField(widget=HiddenInput(), validators=[Optional()])
     submit = SubmitField('Применить')
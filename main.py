@@ -1,10 +1,19 @@
-from flask import Flask, render_template, redirect, make_response, jsonify, request, abort
+import datetime
+import time
+
+import click
+import sqlalchemy as sa
+from flask import Flask, render_template, redirect, make_response, jsonify, request, abort, session, g
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
 
-from data import news_api
+from data import compression, news_api, news_changes, news_stats
 from data.db_session import session_manager
+from data.profiler import profiler
+from data.rate_limit import limiter
 from data.news import News
+from data.news_archive import ArchivedNews, archive_news, archive_requested, ARCHIVE_AFTER_DAYS
 from data.users import User
+from data import users_io
 from forms.loginform import LoginForm
 from forms.news import NewsForm
 from forms.user import Register
@@ -19,6 +28,36 @@ login_manager.init_app(app)
 
 app.config['SECRET_KEY'] = 'just_secret_key'
 
+DB_FILE = 'db/news.sqlite'
+# Сколько секунд после своей записи пользователь читает с основной базы,
+# чтобы сразу видеть свои изменения, даже если реплика отстаёт
+READ_YOUR_WRITES_SECONDS = 5
+
+limiter.init_app(app)
+profiler.init_app(app)
+
+
+@app.before_request
+def route_reads():
+    """GET-запросы читают с реплик, если пользователь недавно ничего не менял."""
+    recently_wrote = session.get('_rw_until', 0) > time.time()
+    g.routing = session_manager.route_reads(request.method in ('GET', 'HEAD')
+                                            and not recently_wrote)
+
+
+@app.after_request
+def remember_writes(response):
+    if session_manager.wrote():
+        session['_rw_until'] = time.time() + READ_YOUR_WRITES_SECONDS
+    return response
+
+
+@app.teardown_request
+def reset_routing(_):
+    routing = g.pop('routing', None)
+    if routing is not None:
+        session_manager.reset_routing(routing)
+
 
 @login_manager.user_loader
 def load_user(user_id):
@@ -46,6 +85,36 @@ def not_authorized(error):
     return redirect('/login')
 
 
+@app.errorhandler(429)
+@app.errorhandler(503)
+def overloaded(error):
+    message = 'Слишком много запросов' if error.code == 429 else 'Сервер перегружен'
+    if request.path.startswith('/api'):
+        response = make_response(jsonify({'error': message}), error.code)
+    else:
+        response = make_response(message, error.code)
+    if error.retry_after:
+        response.headers['Retry-After'] = str(error.retry_after)
+    return response
+
+
+@app.errorhandler(403)
+def forbidden(_):
+    if request.path.startswith('/api'):
+        return make_response(jsonify({'error': 'Доступ запрещён'}), 403)
+    return render_template('403.html', title='Доступ запрещён'), 403
+
+
+@app.cli.command('recompute-stats')
+def recompute_stats():
+    """Пересчитать агрегаты новостей для панели администратора."""
+    session_manager.global_init(DB_FILE)
+    with session_manager.create_session() as db_sess:
+        news_stats.recompute(db_sess)
+        totals = news_stats.get_dashboard(db_sess)
+    print(f"[INFO] Агрегаты пересчитаны, новостей: {totals['total']}")
+
+
 @app.route('/')
 @app.route('/index')
 def index():
@@ -66,10 +135,108 @@ def contacts():
 def all_news():
     with session_manager.create_session() as db_sess:
         news = db_sess.query(News).all()
+        if archive_requested(request.args):
+            news += db_sess.query(ArchivedNews).order_by(ArchivedNews.id).all()
         return render_template('news.html', title='Список новостей', current_page='news', news=news)
 
 
+@app.cli.command('archive-news')
+@click.option('--days', default=ARCHIVE_AFTER_DAYS, show_default=True,
+              help='Переносить новости старше стольких дней.')
+def archive_old_news(days):
+    """Перенести старые новости в архив (news_archive)."""
+    session_manager.global_init(DB_FILE)
+    with session_manager.create_session() as db_sess:
+        moved = archive_news(db_sess, datetime.timedelta(days=days))
+    print(f"[INFO] Перенесено в архив: {moved}")
+
+
+@app.cli.command('compact-changes')
+@click.option('--days', default=news_changes.TOMBSTONE_RETENTION_DAYS, show_default=True,
+              help='Удалять записи об удалениях старше стольких дней.')
+def compact_changes(days):
+    """Сжать журнал изменений новостей (/api/news/changes)."""
+    session_manager.global_init(DB_FILE)
+    with session_manager.create_session() as db_sess:
+        deleted = news_changes.compact(db_sess, datetime.timedelta(days=days))
+    print(f"[INFO] Удалено записей об удалениях: {deleted}")
+
+
+@app.cli.command('compress-news')
+@click.option('--batch-size', default=compression.COMPRESS_BATCH_SIZE, show_default=True)
+@click.option('--pause', default=0.1, show_default=True,
+              help='Пауза между пачками, секунд.')
+def compress_news(batch_size, pause):
+    """Сжать длинные тексты новостей, сохранённые до включения сжатия."""
+    session_manager.global_init(DB_FILE)
+
+    def progress(seen):
+        print(f"[INFO] Обработано новостей: {seen}")
+
+    with session_manager.create_session() as db_sess:
+        seen = compression.compress_existing(db_sess, News.__table__.c.content,
+                                             batch_size=batch_size, pause=pause,
+                                             progress=progress)
+    print(f"[INFO] Готово, обработано новостей: {seen}")
+
+
+@app.cli.command('import-users')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'ndjson']),
+              help='Формат файла (по умолчанию — по расширению).')
+@click.option('--chunk-size', default=users_io.IMPORT_CHUNK_SIZE, show_default=True)
+@click.option('--workers', type=int, help='Процессов для хэширования паролей.')
+@click.option('--checkpoint', type=click.Path(dir_okay=False),
+              help='Файл прогресса (по умолчанию PATH.checkpoint).')
+def import_users(path, fmt, chunk_size, workers, checkpoint):
+    """Массовый импорт пользователей из CSV или NDJSON."""
+    session_manager.global_init(DB_FILE)
+
+    def progress(done, result):
+        print(f"[INFO] Обработано {done}, создано {result.imported}, "
+              f"{result.rate:.0f} польз./с")
+
+    with open(path, encoding='utf-8', newline='') as stream, \
+            session_manager.create_session() as db_sess:
+        result = users_io.import_users(
+            db_sess,
+            users_io.read_users(stream, fmt or users_io.detect_format(path)),
+            chunk_size=chunk_size,
+            workers=workers,
+            checkpoint=checkpoint or f'{path}.checkpoint',
+            progress=progress
+        )
+    print(f"[INFO] Создано: {result.imported}, дубликатов: {result.duplicates}, "
+          f"с ошибками: {result.invalid}, пропущено по checkpoint: {result.skipped}, "
+          f"скорость: {result.rate:.0f} польз./с")
+
+
+@app.cli.command('export-users')
+@click.argument('path', type=click.Path(dir_okay=False, allow_dash=True))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'ndjson']),
+              help='Формат файла (по умолчанию — по расширению).')
+def export_users(path, fmt):
+    """Потоковая выгрузка пользователей в CSV или NDJSON ('-' — stdout)."""
+    session_manager.global_init(DB_FILE)
+    with click.open_file(path, 'w', encoding='utf-8') as stream, \
+            session_manager.create_session() as db_sess:
+        count = users_io.export_users(db_sess, stream, fmt or users_io.detect_format(path))
+    click.echo(f"[INFO] Выгружено пользователей: {count}", err=True)
+
+
+@app.route('/admin')
+@login_required
+def admin():
+    if not current_user.is_admin():
+        abort(403)
+    with session_manager.create_session() as db_sess:
+        stats = news_stats.get_dashboard(db_sess)
+    return render_template('admin.html', title='Панель администратора',
+                           current_page='admin', stats=stats)
+
+
 @app.route('/login', methods=['GET', 'POST'])
+@limiter.limit('login', per_minute=10, burst=5, route_class='auth', methods=('POST',))
 def login():
     form = LoginForm()
     if form.validate_on_submit():
@@ -93,6 +260,7 @@ def logout():
 
 
 @app.route('/register', methods=['POST', 'GET'])
+@limiter.limit('register', per_minute=10, burst=5, route_class='auth', methods=('POST',))
 def register():
     form = Register()
     if form.validate_on_submit():  # тоже самое, что и request.method == 'POST'
@@ -147,7 +315,8 @@ def add_news():
 @app.route('/newsdel/<int:news_id>')
 @login_required
 def news_delete(news_id):
-    with session_manager.create_session() as db_sess:
+    # удаление по GET-ссылке: сессия должна идти на основную базу
+    with session_manager.create_session(read_only=False) as db_sess:
         news = db_sess.query(News).filter(
             News.id == news_id, News.user == current_user
         ).first()
@@ -164,6 +333,34 @@ def news_delete(news_id):
 @login_required
 def edit_news(id_num):
     form = NewsForm()
+    if form.validate_on_submit():
+        with session_manager.create_session() as db_sess:
+            # один UPDATE вместо повторного чтения новости: сохраняем, только
+            # если с момента открытия формы версия не изменилась
+            stmt = (
+                sa.update(News)
+                .where(News.id == id_num,
+                       News.user_id == current_user.id,
+                       News.version == form.version.data)
+                .values(title=form.title.data,
+                        content=form.content.data,
+                        is_private=form.is_private.data,
+                        version=News.version + 1)
+                .execution_options(synchronize_session=False)
+            )
+            if db_sess.execute(stmt).rowcount:
+                db_sess.commit()
+                return redirect('/news')
+            db_sess.rollback()
+            if not db_sess.query(News.id).filter(
+                News.id == id_num, News.user_id == current_user.id
+            ).first():
+                abort(404)
+        return render_template('newsjob.html',
+                               title='Редактирование новости',
+                               message='Новость уже изменили в другом окне. '
+                                       'Обновите страницу и повторите правку',
+                               form=form)
     if request.method == 'GET':
         with session_manager.create_session() as db_sess:
             news = db_sess.query(News).filter(
@@ -173,19 +370,7 @@ def edit_news(id_num):
                 form.title.data = news.title
                 form.content.data = news.content
                 form.is_private.data = news.is_private
-            else:
-                abort(404)
-    if form.validate_on_submit():
-        with session_manager.create_session() as db_sess:
-            news = db_sess.query(News).filter(
-                News.id == id_num, News.user == current_user
-            ).first()
-            if news:
-                news.title = form.title.data
-                news.content = form.content.data
-                news.is_private = form.is_private.data
-                db_sess.commit()
-                return redirect('/news')
+                form.version.data = news.version
             else:
                 abort(404)
     return render_template('newsjob.html',
@@ -194,6 +379,6 @@ def edit_news(id_num):
 
 
 if __name__ == '__main__':
-    session_manager.global_init('db/news.sqlite')
+    session_manager.global_init(DB_FILE)
     app.register_blueprint(news_api.blueprint)  # подключаем blueprint API
     app.run(host='127.0.0.1', port=5000, debug=False)